@@ -66,64 +66,149 @@ LAYOUT
 ------
 - flat (default):   DEST/<sample>/<logical_output_name>
 - by-run:           DEST/<sample>/<run_short>/<logical_output_name>
+
+DIRECTORY OUTPUTS
+-----------------
+By default each tree is linked file-by-file once into the store under
+store/trees-materialized/<digest>, and every sample's directory output is a
+single symlink to it. That shared tree is read-only (dirs 0555), so no sample's
+view can change another's. Pass --expand-dirs to instead recreate the directory
+under DEST and link each file individually.
 """
 
-import json, os, shutil, argparse, fnmatch
+import csv, json, os, re, shutil, stat, subprocess, argparse, fnmatch, functools, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-
-def prefer_link(src: Path, dst: Path) -> str:
-    """Try symlink > hardlink > copy. Returns the method used."""
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    if dst.exists():
-        if dst.is_dir() and not dst.is_symlink():
-            shutil.rmtree(dst)
-        else:
-            dst.unlink()
+try:
+    import orjson  # optional: faster, allocation-lean decoding of large manifests
+except ImportError:  # stdlib fallback keeps the helper dependency-free
+    orjson = None
+try:
+    import ijson  # optional: stream large tree JSON instead of loading it whole
+except ImportError:
+    ijson = None
+
+def _loads(data: bytes):
+    """json.loads, via orjson when available; NaN/Infinity (which orjson rejects) still load."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+def _link_or_copy(src: str, dst: str) -> str:
+    """Create dst from src, symlink > hardlink > copy; FileExistsError propagates."""
     try:
         os.symlink(src, dst)
         return "symlink"
+    except (FileExistsError, FileNotFoundError):
+        raise
     except Exception:
         pass
-    try:
-        if src.is_dir():
-            raise OSError("hardlink-dir-not-supported")
-        os.link(src, dst)
-        return "hardlink"
-    except Exception:
-        pass
-    if src.is_dir():
-        shutil.copytree(src, dst)
-    else:
-        shutil.copy2(src, dst)
+    src_is_dir = os.path.isdir(src)
+    if not src_is_dir:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except FileExistsError:
+            raise
+        except Exception:
+            pass
+    _copy_writable(src, dst, src_is_dir)
     return "copy"
 
+def _copy_writable(src: str, dst: str, src_is_dir: bool) -> None:
+    """copy2/copytree, then add the owner's write bit: blobs are read-only, copies are the user's."""
+    if not src_is_dir:
+        shutil.copy2(src, dst)
+        _add_user_write(dst)
+        return
+    shutil.copytree(src, dst)
+    for base, _dirs, files in os.walk(dst):
+        _add_user_write(base)
+        for name in files:
+            _add_user_write(os.path.join(base, name))
+
+def _add_user_write(p: str) -> None:
+    os.chmod(p, os.stat(p).st_mode | stat.S_IWUSR)
+
+def _remove(dst: str) -> None:
+    st = os.lstat(dst)
+    if stat.S_ISDIR(st.st_mode):
+        shutil.rmtree(dst)
+    else:
+        os.unlink(dst)
+
+def prefer_link(src: str, dst: str) -> str:
+    """Try symlink > hardlink > copy. Returns the method used.
+
+    Works on plain str paths and creates optimistically: a fresh destination
+    costs a single symlink() call. Only when that fails is the parent created,
+    or an existing dst compared with src (kept if it already links there)
+    and replaced.
+    """
+    try:
+        return _link_or_copy(src, dst)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+    except FileExistsError:
+        if _already_linked(src, dst):
+            return "symlink" if os.path.islink(dst) else "hardlink"
+        _remove(dst)
+    return _link_or_copy(src, dst)
+
+def _already_linked(src: str, dst: str) -> bool:
+    """True if dst is already a symlink to src or a hardlink of it."""
+    try:
+        st = os.lstat(dst)
+    except FileNotFoundError:
+        return False
+    if stat.S_ISLNK(st.st_mode):
+        return os.readlink(dst) == src
+    if stat.S_ISREG(st.st_mode):
+        sst = os.stat(src)
+        return st.st_ino == sst.st_ino and st.st_dev == sst.st_dev
+    return False
+
+@functools.lru_cache(maxsize=None)
 def _store_paths(store: Path):
+    # built once per store; callers treat the mapping as read-only
     return {
         "blobs": store / "blobs" / "sha256",
         "trees": store / "trees" / "sha256",
         "manifests": store / "manifests" / "sha256",
         "aliases": store / "aliases",
+        "trees_materialized": store / "trees-materialized",
     }
 
 def _manifest_file_for_run(store: Path, run_id: str) -> Path:
     assert run_id.startswith("sha256:"), "run_id must be sha256:..."
-    fan = run_id.split(':', 1)[1]
+    fan = run_id[7:]
     return _store_paths(store)["manifests"] / fan[:2] / (fan + ".json")
 
 def _read_manifest(store: Path, run_id: str) -> dict:
     p = _manifest_file_for_run(store, run_id)
-    return json.loads(p.read_text(encoding="utf-8"))
+    return _loads(p.read_bytes())
 
-def _blob_path(store: Path, blob_id: str) -> Path:
+def _blob_path(store: Path, blob_id: str) -> str:
     assert blob_id.startswith("sha256:"), "blob id must be sha256:..."
-    fan = blob_id.split(':', 1)[1]
-    return _store_paths(store)["blobs"] / fan[:2] / fan
+    fan = blob_id[7:]
+    return os.path.join(_store_paths(store)["blobs"], fan[:2], fan)
 
 def _read_tree(store: Path, tree_typed_id: str) -> dict:
     assert tree_typed_id.startswith("tree:sha256:"), "expected typed tree id"
-    digest = tree_typed_id.split(':', 2)[2]
+    digest = tree_typed_id[12:]
     p = _store_paths(store)["trees"] / digest[:2] / digest
-    return json.loads(p.read_text(encoding="utf-8"))
+    return _loads(p.read_bytes())
+
+def _iter_tree_entries(store: Path, tree_typed_id: str):
+    """Yield a tree's entries, streamed with ijson so the full list is never resident."""
+    assert tree_typed_id.startswith("tree:sha256:"), "expected typed tree id"
+    digest = tree_typed_id[12:]
+    p = _store_paths(store)["trees"] / digest[:2] / digest
+    with open(p, 'rb') as f:
+        yield from ijson.items(f, 'entries.item')
 
 def _resolve_alias(store: Path, name: str) -> str | None:
     p = _store_paths(store)["aliases"] / name
@@ -133,76 +218,181 @@ def _resolve_alias(store: Path, name: str) -> str | None:
 
 def _resolve_run_identifier(store: Path, value: str) -> str:
     """Return a bare run_id "sha256:..." from a variety of hints."""
-    if value.startswith("run:sha256:"):
-        return value.split(':', 1)[1]
-    if value.startswith("sha256:"):
-        return value
-    if value.startswith("alias:"):
-        target = _resolve_alias(store, value.split(':', 1)[1])
+    seen = set()
+    while True:
+        if value.startswith("run:sha256:"):
+            return value[4:]
+        if value.startswith("sha256:"):
+            return value
+        # "alias:<name>" or a bare "<name>": follow it and re-check the target
+        if value in seen:
+            raise SystemExit(f'Alias cycle at: {value}')
+        seen.add(value)
+        target = _resolve_alias(store, value[6:] if value.startswith("alias:") else value)
         if not target:
             raise SystemExit(f'Alias not found: {value}')
-        return _resolve_run_identifier(store, target)
-    target = _resolve_alias(store, value)
-    if not target:
-        raise SystemExit(f'Alias not found: {value}')
-    return _resolve_run_identifier(store, target)
-
-def _iter_selected_outputs(manifest: dict, selects: list[str] | None):
-    """Yield (logical_name, type, id) for outputs matching the selection patterns."""
-    outs = manifest.get('outputs', [])
+        value = target
+
+def _compile_selects(selects: list[str] | None) -> re.Pattern | None:
+    """Union all select globs into one compiled regex ('name/**' matches 'name').
+
+    Returns None (no filtering) when there is nothing to select on or when a
+    pattern such as '*' matches every name anyway.
+    """
     if not selects:
+        return None
+    pats = [p[:-3] if p.endswith('/**') else p for p in selects]
+    if any(p in ('*', '**') for p in pats):
+        return None
+    return re.compile('|'.join('(?:%s)' % fnmatch.translate(p) for p in pats))
+
+def _iter_selected_outputs(manifest: dict, select_re: re.Pattern | None):
+    """Yield (logical_name, type, id) for outputs matching the compiled selection."""
+    outs = manifest.get('outputs', [])
+    if select_re is None:
         for o in outs:
             yield o['logical_name'], o['type'], o['id']
         return
     for o in outs:
-        name = o['logical_name']
-        for pat in selects:
-            if pat.endswith('/**'):
-                base = pat[:-3]
-                if fnmatch.fnmatch(name, base):
-                    yield name, o['type'], o['id']
-                    break
-            else:
-                if fnmatch.fnmatch(name, pat):
-                    yield name, o['type'], o['id']
-                    break
+        if select_re.match(o['logical_name']):
+            yield o['logical_name'], o['type'], o['id']
+
+def _mkdir_once(d: str, made: set[str]) -> None:
+    """mkdir -p d unless already done; records d and its ancestors in made."""
+    if d in made:
+        return
+    os.makedirs(d, exist_ok=True)
+    while d not in made and os.path.dirname(d) != d:
+        made.add(d)
+        d = os.path.dirname(d)
 
 def _short_run(run_id: str, n: int = 12) -> str:
     return run_id.split(':', 1)[1][:n]
 
+def _fast_rmtree(path: Path) -> None:
+    """rm -rf path; the native tool beats shutil's per-node walk on large views."""
+    if os.name == 'posix':
+        try:
+            subprocess.run(['rm', '-rf', '--', str(path)], check=True)
+            return
+        except (OSError, subprocess.CalledProcessError):
+            pass
+    shutil.rmtree(path)
+
+def _cached_reader(load):
+    """Memoize a one-argument loader; safe to share between worker threads."""
+    cache: dict = {}
+    lock = threading.Lock()
+    def get(key):
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        value = load(key)
+        with lock:
+            return cache.setdefault(key, value)
+    return get
+
+def _materialize_tree_once(store: Path, tree_typed_id: str, tree_entries) -> str | None:
+    """
+    Link a tree's files once under store/trees-materialized/<digest>; return that dir.
+    None if the store cannot hold it (e.g. read-only or shared): callers expand instead.
+    The published tree is read-only, since every sample's view of it is the same directory.
+    """
+    digest = tree_typed_id[12:]
+    root = os.path.join(_store_paths(store)["trees_materialized"], digest)
+    if os.path.isdir(root):
+        return root
+    # build privately, then publish with an atomic rename
+    tmp = f"{root}.tmp-{os.getpid()}-{threading.get_ident()}"
+    made = {tmp}
+    try:
+        os.makedirs(tmp, exist_ok=True)
+        for e in tree_entries(tree_typed_id):
+            out = os.path.join(tmp, e['path'])
+            _mkdir_once(os.path.dirname(out), made)
+            if prefer_link(_blob_path(store, e['blob']), out) == "copy":
+                os.chmod(out, 0o444)
+        for d in made:
+            os.chmod(d, 0o555)
+        os.rename(tmp, root)
+    except OSError:  # another worker published it first, or the store is not writable
+        for d in made:  # let rmtree clear a half-built tmp
+            try:
+                os.chmod(d, 0o755)
+            except OSError:
+                pass
+        shutil.rmtree(tmp, ignore_errors=True)
+        return root if os.path.isdir(root) else None
+    return root
+
+def _materialize_sample(store: Path, sample: str, ref: str, dest: Path, select_re: re.Pattern | None,
+                        layout: str, expand_dirs: bool, resolve_run, read_manifest, tree_entries,
+                        tree_root) -> None:
+    run_id = resolve_run(ref)
+    m = read_manifest(run_id)
+
+    # destination base for this sample
+    if layout == 'by-run':
+        base = dest / sample / _short_run(run_id)
+    else:
+        base = dest / sample
+    base.mkdir(parents=True, exist_ok=True)
+
+    # dst -> src, collected first so repeated destinations are linked once
+    plan: dict[str, str] = {}
+    for name, typ, _id in _iter_selected_outputs(m, select_re):
+        target = os.path.join(base, name)
+        if typ == 'file':
+            plan[target] = _blob_path(store, 'sha256:' + _id)
+        elif typ == 'dir' and not expand_dirs and (root := tree_root('tree:sha256:' + _id)):
+            # one symlink to the shared materialized tree instead of N links
+            plan[target] = root
+        elif typ == 'dir':
+            if os.path.islink(target):
+                os.unlink(target)  # never expand into the shared tree
+            os.makedirs(target, exist_ok=True)
+            made = {target}
+            for e in tree_entries('tree:sha256:' + _id):
+                out = os.path.join(target, e['path'])
+                _mkdir_once(os.path.dirname(out), made)
+                plan[out] = _blob_path(store, e['blob'])
+        else:
+            raise SystemExit(f'Unknown output type: {typ}')
+
+    # prefer_link leaves destinations that already link to src untouched
+    for dst, src in plan.items():
+        prefer_link(src, dst)
+
 def aggregate(store: Path, mapping: dict[str, str], dest: Path, selects: list[str] | None,
-              layout: str = 'flat', clear: bool = False) -> None:
+              layout: str = 'flat', clear: bool = False, expand_dirs: bool = False) -> None:
     if clear and dest.exists():
-        shutil.rmtree(dest)
+        _fast_rmtree(dest)
     dest.mkdir(parents=True, exist_ok=True)
-
-    for sample, ref in mapping.items():
-        run_id = _resolve_run_identifier(store, ref)
-        m = _read_manifest(store, run_id)
-
-        # destination base for this sample
-        if layout == 'by-run':
-            base = dest / sample / _short_run(run_id)
-        else:
-            base = dest / sample
-        base.mkdir(parents=True, exist_ok=True)
-
-        # place outputs
-        for name, typ, _id in _iter_selected_outputs(m, selects):
-            target = base / name
-            if typ == 'file':
-                src = _blob_path(store, 'sha256:' + _id)
-                prefer_link(src, target)
-            elif typ == 'dir':
-                target.mkdir(parents=True, exist_ok=True)
-                tree = _read_tree(store, 'tree:sha256:' + _id)
-                for e in tree['entries']:
-                    src = _blob_path(store, e['blob'])
-                    out = target / e['path']
-                    out.parent.mkdir(parents=True, exist_ok=True)
-                    prefer_link(src, out)
-            else:
-                raise SystemExit(f'Unknown output type: {typ}')
+    select_re = _compile_selects(selects)
+
+    # samples commonly fan in to a few runs/aliases: read and parse each once
+    readers = (
+        _cached_reader(lambda ref: _resolve_run_identifier(store, ref)),
+        _cached_reader(lambda run_id: _read_manifest(store, run_id)),
+        # with ijson, trees are streamed per use rather than held in memory
+        (lambda tree_id: _iter_tree_entries(store, tree_id)) if ijson is not None
+        else _cached_reader(lambda tree_id: _read_tree(store, tree_id)['entries']),
+    )
+    tree_root = _cached_reader(lambda tree_id: _materialize_tree_once(store, tree_id, readers[2]))
+
+    # per-sample work is stat/link/mkdir syscalls, which release the GIL
+    if len(mapping) <= 1:
+        for sample, ref in mapping.items():
+            _materialize_sample(store, sample, ref, dest, select_re, layout, expand_dirs, *readers, tree_root)
+        return
+    workers = min(32, (os.cpu_count() or 1) * 4, len(mapping))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futs = [ex.submit(_materialize_sample, store, sample, ref, dest, select_re, layout, expand_dirs,
+                          *readers, tree_root)
+                for sample, ref in mapping.items()]
+        for f in as_completed(futs):
+            f.result()
 
 def _parse_map_args(items: list[str]) -> dict[str, str]:
     out = {}
@@ -225,13 +415,18 @@ def _load_map_file(path: str | None) -> dict[str, str]:
             raise SystemExit('JSON map must be an object {sample: run_or_alias}')
         return {str(k): str(v) for k, v in data.items()}
     elif p.suffix.lower() in {'.csv', '.tsv'}:
-        import csv
         delim = ',' if p.suffix.lower() == '.csv' else '\t'
-        res = {}
+        # plain reader + column indexes: no per-row dict for large mappings
         with open(p, newline='', encoding='utf-8') as f:
-            for row in csv.DictReader(f, delimiter=delim):
-                res[row['sample']] = row['run']
-        return res
+            r = csv.reader(f, delimiter=delim)
+            header = next(r, None)
+            if not header:
+                return {}
+            try:
+                s_idx, r_idx = header.index('sample'), header.index('run')
+            except ValueError:
+                raise SystemExit("Map file needs 'sample' and 'run' columns")
+            return {row[s_idx]: row[r_idx] for row in r if row}
     else:
         raise SystemExit('Unsupported map file format (use .json, .csv, or .tsv)')
 
@@ -244,6 +439,8 @@ def main(argv=None):
     ap.add_argument('--select', action='append', default=[], help='Glob over logical output names (repeatable). If omitted, include all.')
     ap.add_argument('--layout', choices=['flat','by-run'], default='flat', help='Directory layout (default: flat)')
     ap.add_argument('--clear', action='store_true', help='Delete destination directory before writing')
+    ap.add_argument('--expand-dirs', action=argparse.BooleanOptionalAction, default=False,
+                    help='Link directory outputs file-by-file instead of one symlink per directory (default: no)')
     args = ap.parse_args(argv)
 
     store = Path(args.store).resolve()
@@ -256,7 +453,8 @@ def main(argv=None):
     if not mapping:
         raise SystemExit('No samples provided. Use --map or --map-file.')
 
-    aggregate(store, mapping, dest, args.select or None, layout=args.layout, clear=args.clear)
+    aggregate(store, mapping, dest, args.select or None, layout=args.layout, clear=args.clear,
+              expand_dirs=args.expand_dirs)
     print(str(dest))
 
 if __name__ == '__main__':
@@ -2,30 +2,53 @@
 # Normalization should accout for: types (e.g. Path -> str), order, explicit defaults (remove all not step related)
 # maybe even fix precision types on floats, ints, etc.
 
+import json
+from pathlib import Path
+try:
+    import numpy as np
+except ImportError:  # numpy scalars can only appear if numpy is installed
+    np = None
+
+# exact types only: np.float64 subclasses float but should still be converted
+_SCALARS = (str, int, float, bool, type(None))
+
 def deep_merge(base, override):
+    # iterative: only dicts on merged paths are copied (base is never mutated),
+    # and deeply nested TOML cannot hit the recursion limit
     out = dict(base)
-    for k, v in override.items():
-        if isinstance(v, dict) and isinstance(out.get(k), dict):
-            out[k] = deep_merge(out[k], v)
-        else:
-            out[k] = v
+    stack = [(out, override)]
+    while stack:
+        dst, src = stack.pop()
+        for k, v in src.items():
+            if isinstance(v, dict) and isinstance(dst.get(k), dict):
+                dst[k] = dict(dst[k])
+                stack.append((dst[k], v))
+            else:
+                dst[k] = v
     return out
 
 def normalize_config(cfg):
-    from pathlib import Path
-    import numpy as np
     def norm(x):
         if isinstance(x, dict):
-            return {k: norm(x[k]) for k in sorted(x)}   # sort keys
+            keys = sorted(x)                            # sort keys
+            # already-canonical leaf mapping: nothing to rebuild
+            if keys == list(x) and all(type(v) in _SCALARS for v in x.values()):
+                return x
+            return {k: norm(x[k]) for k in keys}
         if isinstance(x, (list, tuple, set)):
             return [norm(i) for i in x]                 # stable sequence
         if isinstance(x, Path):
             return str(x)
-        if isinstance(x, (np.integer,)):  return int(x)
-        if isinstance(x, (np.floating,)): return float(x)
+        if np is not None:
+            if isinstance(x, (np.integer,)):  return int(x)
+            if isinstance(x, (np.floating,)): return float(x)
         return x
     return norm(cfg)
 
+def canonical_json_bytes(canonical) -> bytes:
+    """Sorted-key, whitespace-free JSON; stdlib only, like repro.hashing.canonical_json."""
+    return json.dumps(canonical, sort_keys=True, separators=(",",":")).encode("utf-8")
+
 def extract_step_relevant(cfg: dict, step: str) -> dict:
 	step_cfg = cfg.get("steps", {}).get(step, {})
 	# e.g.	
@@ -41,7 +64,7 @@ canonical = normalize_config(resolved)
 
 # Save both:
 (Path(run_prov)/"config.toml").write_text(original_toml_text)
-(Path(run_prov)/"config.json").write_text(json.dumps(canonical, sort_keys=True, separators=(",",":")))
+(Path(run_prov)/"config.json").write_bytes(canonical_json_bytes(canonical))
 
 # --- EXAMPLE CONFIG --- 
 # [paths]
@@ -1,13 +1,18 @@
 from __future__ import annotations
-import argparse, sys, json
+import argparse, ast, os, shutil, sys, json, types
 from pathlib import Path
 from .store import default_store_path, ensure_layout, alias_set, alias_get, load_manifest, manifest_path
 from .store import commit_blob, commit_tree, blob_path, read_tree
-from .runner import run_step_file
+from .store import output_index_path, lookup_output, reindex_outputs
+from .runner import run_step_file, import_step_module
 from .config import parse_keyval_list, load_config, merge_params
 from .hashing import sha256_bytes, canonical_json
 from .manifest import minimal_env_summary
-from .util import prefer_link
+from .util import prefer_link, copy_writable
+try:
+    import ijson  # optional: stream manifests in who-built/trace scans
+except ImportError:  # pragma: no cover - skeleton stays stdlib-only
+    ijson = None
 
 def main(argv=None):
     parser = argparse.ArgumentParser(prog="repro", description="Reproducible CAS pipeline (stdlib skeleton)")
@@ -63,6 +68,10 @@ def main(argv=None):
     p_trace.add_argument("typed_id", help="blob:sha256:.. or tree:sha256:..")
     p_trace.add_argument("--store", default=None)
 
+    # reindex
+    p_reindex = sub.add_parser("reindex", help="Index every manifest in the store for who-built/trace (e.g. after copying manifests in)")
+    p_reindex.add_argument("--store", default=None)
+
     args = parser.parse_args(argv)
 
     if args.cmd == "run":
@@ -108,7 +117,7 @@ def main(argv=None):
             dest = Path(args.into).resolve()
             if dest.exists():
                 # overwrite for skeleton simplicity
-                import shutil; shutil.rmtree(dest)
+                shutil.rmtree(dest)
             dest.mkdir(parents=True, exist_ok=True)
             # For each output, materialize by preferred method
             for o in m.get("outputs", []):
@@ -144,46 +153,76 @@ def main(argv=None):
         for line in _trace_to_sources(store, args.typed_id):
             print(line)
 
+    elif args.cmd == "reindex":
+        store = Path(args.store).resolve() if args.store else default_store_path()
+        print(reindex_outputs(store))
+
 # ---- helpers ----
+def _static_defaults(p: Path) -> dict | None:
+    """
+    Read a literal top-level `DEFAULTS = {...}` from the step source without
+    executing it. Returns None when DEFAULTS is absent, not a literal, or
+    referenced anywhere else in the module (it might be modified later).
+    """
+    try:
+        tree = ast.parse(p.read_text(encoding="utf-8"), filename=str(p))
+    except (OSError, SyntaxError, ValueError):
+        return None
+    refs = sum(isinstance(n, ast.Name) and n.id == "DEFAULTS" for n in ast.walk(tree))
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            targets, value = node.targets, node.value
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            targets, value = [node.target], node.value
+        else:
+            continue
+        if len(targets) == 1 and isinstance(targets[0], ast.Name) and targets[0].id == "DEFAULTS":
+            if refs != 1:
+                return None
+            try:
+                value = ast.literal_eval(value)
+            except ValueError:
+                return None
+            return value if isinstance(value, dict) else None
+    return None
+
 def _load_defaults_from_step(step_file: str):
-    import importlib.util, types
     p = Path(step_file).resolve()
-    spec = importlib.util.spec_from_file_location(f"repro_step_{abs(hash(p))}_defaults", p)
-    mod = importlib.util.module_from_spec(spec)  # type: ignore
-    assert spec and spec.loader
-    spec.loader.exec_module(mod)  # type: ignore
-    return mod
+    # Fast path: avoid importing the step (and its heavy deps) just for DEFAULTS
+    defaults = _static_defaults(p)
+    if defaults is not None:
+        return types.SimpleNamespace(DEFAULTS=defaults)
+    # Slow path: execute the step once per (path, mtime) in this process;
+    # the run itself re-executes it, so globals set here do not leak into it
+    return import_step_module(p, cached=True)
 
 def _materialize_tree(store: Path, tree_data: dict, outdir: Path, mode: str | None):
     outdir.mkdir(parents=True, exist_ok=True)
-    from .store import blob_path
-    from .util import prefer_link
-    import shutil
+    made = {outdir}  # parents already created; avoids one mkdir per entry
     for e in tree_data["entries"]:
         src = blob_path(store, e["blob"])
         dst = outdir / e["path"]
-        dst.parent.mkdir(parents=True, exist_ok=True)
+        parent = dst.parent
+        if parent not in made:
+            parent.mkdir(parents=True, exist_ok=True)
+            while parent not in made and parent.parent != parent:
+                made.add(parent)
+                parent = parent.parent
         if mode is None:
             prefer_link(src, dst)
         elif mode == "symlink":
-            import os
             try:
                 os.symlink(src, dst)
             except Exception:
                 raise SystemExit("Symlinks not supported on this system for the selected mode")
         elif mode == "hardlink":
-            import os
             if src.is_dir():
                 raise SystemExit("Cannot hardlink a directory entry")
             os.link(src, dst)
         elif mode == "copy":
-            if src.is_dir():
-                shutil.copytree(src, dst)
-            else:
-                shutil.copy2(src, dst)
+            copy_writable(src, dst)
 
 def _force_link(src: Path, dst: Path, mode: str):
-    import os, shutil
     dst.parent.mkdir(parents=True, exist_ok=True)
     if mode == "symlink":
         os.symlink(src, dst); return "symlink"
@@ -191,8 +230,7 @@ def _force_link(src: Path, dst: Path, mode: str):
         if src.is_dir(): raise SystemExit("hardlink-dir-not-supported")
         os.link(src, dst); return "hardlink"
     elif mode == "copy":
-        if src.is_dir(): shutil.copytree(src, dst)
-        else: shutil.copy2(src, dst)
+        copy_writable(src, dst)
         return "copy"
     else:
         raise SystemExit("Unknown mode")
@@ -206,6 +244,26 @@ def _iter_manifests(store: Path):
             if f.suffix == ".json":
                 yield f
 
+def _iter_manifest_outputs(mf: Path):
+    """
+    Yield the output entries of a manifest file.
+    With ijson installed only the 'outputs' array is parsed, lazily, so a
+    caller that stops at the first match never decodes the rest of the file.
+    ijson rejects NaN/Infinity, which manifests may hold; those files are
+    re-read with json, skipping the entries already yielded.
+    """
+    done = 0
+    if ijson is not None:
+        try:
+            with open(mf, "rb") as f:
+                for o in ijson.items(f, "outputs.item"):
+                    done += 1
+                    yield o
+            return
+        except ijson.JSONError:
+            pass
+    yield from json.loads(mf.read_text(encoding="utf-8")).get("outputs", [])[done:]
+
 def _who_built_scan(store: Path, typed_id: str) -> str | None:
     lookup_id = None
     key = None
@@ -215,12 +273,16 @@ def _who_built_scan(store: Path, typed_id: str) -> str | None:
         lookup_id = typed_id.split(":",2)[2]; key = "dir"
     else:
         raise SystemExit("typed_id must be blob:sha256:.. or tree:sha256:..")
+    if output_index_path(store).exists():
+        # authoritative: backfilled when created, updated on every manifest write
+        return lookup_output(store, key, lookup_id)
+    # No index yet: scan manifests
     for mf in _iter_manifests(store):
         try:
-            m = json.loads(mf.read_text(encoding="utf-8"))
-            for o in m.get("outputs", []):
+            for o in _iter_manifest_outputs(mf):
                 if o.get("type") == key and o.get("id") == lookup_id:
-                    return m.get("run_id")
+                    # manifests live at manifests/sha256/<hex[:2]>/<hex[2:]>.json
+                    return "sha256:" + mf.parent.name + mf.stem
         except Exception:
             continue
     return None
@@ -244,7 +306,6 @@ def _trace_to_sources(store: Path, typed_id: str):
             yield f"{indent}  (no producing run; likely adopted source)"
             continue
         # Load manifest and enqueue its inputs
-        from .store import load_manifest
         m = load_manifest(store, run_id)
         for inp in m.get("inputs", []):
             typ = inp["type"]
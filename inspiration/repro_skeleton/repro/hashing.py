@@ -1,32 +1,129 @@
 from __future__ import annotations
-import hashlib, json, os, ast
+import functools, hashlib, json, math, os, ast
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 CHUNK = 1024 * 1024 * 8  # 8MB streaming chunks
+FILE_DIGEST_MIN = 1024 * 1024  # hashlib.file_digest (3.11+) only pays off above ~1MB
 
-def sha256_file(path: Path) -> str:
+try:  # optional: faster JSON encoding for store files
+    import orjson
+except ImportError:
+    orjson = None
+
+def sha256_new(data: bytes = b""):
+    """
+    New SHA-256 hasher; the single primitive every hash in the skeleton uses.
+    hashlib.sha256 is already OpenSSL's (SHA-NI / ARMv8 SHA where available).
+    """
+    return hashlib.sha256(data, usedforsecurity=False)
+
+def sha256_file(path: Path | str) -> str:
     """
     Stream a file and return 'sha256:<hex>'.
+    Multi-chunk files overlap reading the next chunk with hashing the current
+    one (plain reads, never mmap: a file truncated mid-hash must not SIGBUS).
+    Single-chunk files above FILE_DIGEST_MIN go through hashlib.file_digest,
+    whose small reused buffer beats one big read; tiny files keep the plain read.
+    """
+    h = sha256_new()
+    with open(path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if size > CHUNK:
+            _hash_overlapped(f, h)
+        elif size > FILE_DIGEST_MIN and hasattr(hashlib, "file_digest"):
+            h = hashlib.file_digest(f, sha256_new)
+        else:
+            while True:
+                b = f.read(CHUNK)
+                if not b:
+                    break
+                h.update(b)
+    return "sha256:" + h.hexdigest()
+
+def _hash_overlapped(f, h) -> None:
     """
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
+    Feed f into h with one chunk of read-ahead: a helper thread readinto()s
+    the spare buffer while the caller hashes the filled one, in file order.
+    """
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    bufs = (bytearray(CHUNK), bytearray(CHUNK))
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        i = 0
+        pending = reader.submit(f.readinto, bufs[i])
         while True:
-            b = f.read(CHUNK)
-            if not b:
+            n = pending.result()
+            if not n:
                 break
-            h.update(b)
-    return "sha256:" + h.hexdigest()
+            filled = memoryview(bufs[i])[:n]
+            i ^= 1
+            pending = reader.submit(f.readinto, bufs[i])
+            h.update(filled)
 
 def sha256_bytes(data: bytes) -> str:
-    return "sha256:" + hashlib.sha256(data).hexdigest()
+    return "sha256:" + sha256_new(data).hexdigest()
 
 def canonical_json(obj) -> bytes:
     """
     Canonical JSON for hashing: UTF-8, sorted keys, no whitespace.
     Note: for learning simplicity we leave values as provided (strings/numbers).
+    Always the stdlib encoder, whether or not orjson is installed (see json_bytes).
     """
     return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
 
+def json_bytes(obj, indent: bool = False, sort_keys: bool = False) -> bytes:
+    """
+    UTF-8 JSON for files written to the store (never for hashing).
+    orjson when available, else json; both load back to the same data. Data
+    holding NaN/Infinity always goes through json: orjson would write null.
+    Float spelling may differ between the two (1e-7 vs 1e-07), which is why
+    hashed bytes never come from here.
+    """
+    if orjson is not None:
+        opt = (orjson.OPT_INDENT_2 if indent else 0) | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            out = orjson.dumps(obj, option=opt)
+        except TypeError:  # e.g. ints beyond 64 bits
+            pass
+        else:
+            # NaN/Infinity come out as null, so only then look for them
+            if b"null" not in out or not _has_nonfinite(obj):
+                return out
+    return json.dumps(obj, indent=2 if indent else None, sort_keys=sort_keys,
+                      ensure_ascii=False).encode("utf-8")
+
+def _has_nonfinite(obj) -> bool:
+    stack = [obj]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, float):
+            if not math.isfinite(x):
+                return True
+        elif isinstance(x, dict):
+            stack.extend(x.values())
+        elif isinstance(x, (list, tuple)):
+            stack.extend(x)
+    return False
+
+def hash_input_triples(triples) -> str:
+    """
+    Hash sorted (name, type, hex digest) input triples with a fixed binary
+    layout: name 0x1F type 0x1F digest(32 bytes) 0x1E, per triple.
+    The digest may carry a 'sha256:' prefix (adopted directories record one).
+    """
+    h = sha256_new()
+    for name, kind, digest_hex in triples:
+        if digest_hex.startswith("sha256:"):
+            digest_hex = digest_hex[7:]
+        h.update(name.encode("utf-8"))
+        h.update(b"\x1f")
+        h.update(kind.encode("utf-8"))
+        h.update(b"\x1f")
+        h.update(bytes.fromhex(digest_hex))
+        h.update(b"\x1e")
+    return "sha256:" + h.hexdigest()
+
 def combine_hashes(*ids: str) -> str:
     """
     Combine multiple 'sha256:...' strings deterministically.
@@ -39,9 +136,16 @@ def code_hash_ast(path: Path) -> str:
     """
     Hash the AST of a Python file (ignores whitespace/comments/formatting).
     This is a simple normalization and not a perfect semantic hash.
+    Results are memoized per (path, inode, mtime, ctime, size) like the store's
+    inode cache, so an edit or a file swapped in under the same name invalidates them.
     """
-    src = path.read_text(encoding="utf-8")
-    tree = ast.parse(src, filename=str(path))
+    st = os.stat(path)
+    return _code_hash_ast_cached(str(path), st.st_ino, st.st_mtime_ns, st.st_ctime_ns, st.st_size)
+
+@functools.lru_cache(maxsize=512)
+def _code_hash_ast_cached(path: str, ino: int, mtime_ns: int, ctime_ns: int, size: int) -> str:
+    src = Path(path).read_text(encoding="utf-8")
+    tree = ast.parse(src, filename=path)
     # Dump without attributes to reduce noise
     dumped = ast.dump(tree, annotate_fields=False, include_attributes=False)
     return sha256_bytes(dumped.encode("utf-8"))
@@ -52,32 +156,54 @@ def iter_files(root: Path):
     Yield relative file paths (as POSIX strings) under root, sorted.
     Follows symlinks for simplicity; skips non-regular files.
     """
+    for rel, _size in scan_files(root):
+        yield rel
+
+def scan_files(root: Path) -> list[tuple[str, int]]:
+    """
+    Sorted [(relative POSIX path, size)] for the files iter_files yields.
+    One os.scandir pass: file/dir checks use the DirEntry's cached d_type,
+    and the size comes from the same entry, so files are not re-stat'ed.
+    """
     files = []
-    for base, dirs, filenames in os.walk(root, followlinks=True):
-        base_p = Path(base)
-        for name in filenames:
-            fp = base_p / name
-            try:
-                if not fp.is_file():
+    stack = [(os.fspath(root), "")]
+    while stack:
+        d, prefix = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        stack.append((entry.path, prefix + entry.name + "/"))
+                    elif entry.is_file():
+                        files.append((prefix + entry.name, entry.stat().st_size))
+                except OSError:
                     continue
-            except OSError:
-                continue
-            rel = fp.relative_to(root).as_posix()
-            files.append(rel)
-    for rel in sorted(files):
-        yield rel
+    files.sort()
+    return files
+
+def tree_id_of(entries) -> str:
+    """
+    Tree id for path-sorted {path, blob, size} entries: sha256 over canonical
+    JSON of [(path, blob_id)].
+    """
+    return sha256_bytes(canonical_json([[e["path"], e["blob"]] for e in entries]))
 
 def tree_snapshot(root: Path):
     """
     Compute snapshot entries for a directory: list of {path, blob, size}.
-    The tree id is sha256 over canonical JSON of [(path, blob_id)].
-    """
-    entries = []
-    pairs = []
-    for rel in iter_files(root):
-        blob_id = sha256_file(root / rel)
-        size = (root / rel).stat().st_size
-        entries.append({"path": rel, "blob": blob_id, "size": int(size)})
-        pairs.append([rel, blob_id])
-    tree_id = sha256_bytes(canonical_json(pairs))
-    return tree_id, entries
+    The tree id is tree_id_of(entries).
+    """
+    root_s = os.fspath(root)
+    def hash_one(item: tuple[str, int]):
+        rel, size = item
+        return rel, sha256_file(os.path.join(root_s, rel)), size  # str join: no Path per file
+    files = scan_files(root)
+    # hashlib and file reads release the GIL; map() keeps the sorted order
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        hashed = list(ex.map(hash_one, files))
+    entries = [{"path": rel, "blob": blob_id, "size": int(size)} for rel, blob_id, size in hashed]
+    return tree_id_of(entries), entries
@@ -1,5 +1,5 @@
 from __future__ import annotations
-import json, platform, sys, os, datetime
+import functools, json, platform, sys, os, datetime
 from typing import Dict, List
 
 def utc_now_iso() -> str:
@@ -16,13 +16,25 @@ def minimal_env_summary(capture_packages: bool = False) -> dict:
     }
     if capture_packages:
         try:
-            import importlib.metadata as im
-            pkgs = [{"name": d.metadata["Name"], "version": d.version} for d in im.distributions()]
-            env["packages"] = sorted(pkgs, key=lambda x: x["name"].lower())
+            env["packages"] = [dict(p) for p in _package_list()]
         except Exception:
             env["packages_error"] = "failed_to_capture"
     return env
 
+@functools.lru_cache(maxsize=1)
+def _package_list() -> tuple:
+    """
+    Installed distributions as ({name, version}, ...) sorted by name; computed
+    once per process. Each METADATA file is parsed once (d.name and d.version
+    would each parse it again).
+    """
+    import importlib.metadata as im
+    pkgs = []
+    for d in im.distributions():
+        md = d.metadata
+        pkgs.append({"name": md["Name"], "version": md["Version"]})
+    return tuple(sorted(pkgs, key=lambda x: x["name"].lower()))
+
 def input_list_from_map(d: Dict[str, dict]) -> List[dict]:
     """
     Convert inputs dict {name: {type,id,size,origin}} to a sorted list for manifest.
@@ -1,14 +1,19 @@
 from __future__ import annotations
 import importlib.util, types, inspect, json, os, tempfile, shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from .context import RunContext
 from .decorators import load as deco_load, core as deco_core, save as deco_save
-from .hashing import code_hash_ast, canonical_json, combine_hashes, sha256_bytes
-from .hashing import sha256_file
+from .hashing import code_hash_ast, canonical_json, combine_hashes, sha256_bytes, hash_input_triples
+from .hashing import sha256_file, sha256_new
 from .store import default_store_path, ensure_layout, commit_blob, commit_tree, blob_path
 from .store import write_manifest, manifest_path, read_tree, alias_get, alias_set
 from .manifest import minimal_env_summary, utc_now_iso, input_list_from_map, outputs_from_dir_scan
-from .util import prefer_link
+from .util import prefer_link, prefer_link_tree
+
+# Bumped whenever run ids are derived differently, so old and new ids can be told apart.
+# 2: input_hash over hash_input_triples (binary) instead of canonical JSON triples
+MANIFEST_VERSION = 2
 
 # ---- Discover decorated functions in a step module ----
 def discover_functions(mod: types.ModuleType):
@@ -22,11 +27,29 @@ def discover_functions(mod: types.ModuleType):
         raise SystemExit("Step module must define three decorated functions: @load, @core, @save")
     return load_fn, core_fn, save_fn
 
-def import_step_module(path: Path) -> types.ModuleType:
-    spec = importlib.util.spec_from_file_location(f"repro_step_{abs(hash(path))}", path)
+_MOD_CACHE: dict[tuple[str, int], types.ModuleType] = {}
+
+def import_step_module(path: Path, cached: bool = False) -> types.ModuleType:
+    """
+    Import a step file under a name derived from the path's sha256, so it is
+    stable across interpreters (hash() of a path is salted per process).
+    Every call executes the file afresh, so module-level state never carries
+    over from one run to the next. cached=True reuses one module per
+    (resolved path, mtime) instead; only for reading DEFAULTS, never for runs.
+    """
+    p = Path(path).resolve()
+    key = (str(p), p.stat().st_mtime_ns)
+    if cached:
+        mod = _MOD_CACHE.get(key)
+        if mod is not None:
+            return mod
+    name = "repro_step_" + sha256_new(str(p).encode("utf-8")).hexdigest()[:16]
+    spec = importlib.util.spec_from_file_location(name, p)
     mod = importlib.util.module_from_spec(spec)  # type: ignore
     assert spec and spec.loader
     spec.loader.exec_module(mod)  # type: ignore
+    if cached:
+        _MOD_CACHE[key] = mod
     return mod
 
 # ---- Input spec parsing ----
@@ -82,23 +105,42 @@ def materialize_input(store: Path, typed_id: str, dst: Path) -> str:
     else:
         raise SystemExit(f"Cannot materialize id: {typed_id}")
 
+def _commit_output(store: Path, entry: Path):
+    """
+    Commit one top-level output (file or directory); None for anything else.
+    """
+    if entry.is_dir():
+        tree_typed_id, entries = commit_tree(store, entry, link_ok=True)
+        total = sum(int(e.get("size", 0)) for e in entries)
+        return {"type":"dir","id": tree_typed_id.split(":",1)[1], "size": int(total)}
+    elif entry.is_file():
+        blob_id = commit_blob(store, entry, link_ok=True)
+        size = entry.stat().st_size
+        return {"type":"file","id": blob_id.split(":",1)[1], "size": int(size)}
+    return None
+
 def scan_outputs_and_commit(store: Path, out_dir: Path) -> dict:
     """
     Scan top-level items under out_dir and commit them.
     Returns mapping {logical_name: {type,id,size,mime?}} (size optional for dirs).
+    out_dir is discarded after the run, so files may be hardlinked into CAS.
+    Top-level files are committed on one thread pool (hashing and file I/O
+    release the GIL; CAS writes are idempotent and land via os.replace).
+    Directories go one at a time, since commit_tree runs its own cpu-wide pool
+    and nesting pools would oversubscribe. Results keep the sorted name order.
     """
-    outputs = {}
-    for entry in sorted(out_dir.iterdir() if out_dir.exists() else []):
-        name = entry.name
-        if entry.is_dir():
-            tree_typed_id, entries = commit_tree(store, entry)
-            total = sum(int(e.get("size", 0)) for e in entries)
-            outputs[name] = {"type":"dir","id": tree_typed_id.split(":",1)[1], "size": int(total)}
-        elif entry.is_file():
-            blob_id = commit_blob(store, entry)
-            size = entry.stat().st_size
-            outputs[name] = {"type":"file","id": blob_id.split(":",1)[1], "size": int(size)}
-    return outputs
+    items = sorted(out_dir.iterdir() if out_dir.exists() else [])
+    dirs = [entry for entry in items if entry.is_dir()]
+    files = [entry for entry in items if not entry.is_dir()]
+    results = {}
+    if len(files) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(files), os.cpu_count() or 1)) as ex:
+            results.update(zip(files, ex.map(_commit_output, [store] * len(files), files)))
+    else:
+        results.update((entry, _commit_output(store, entry)) for entry in files)
+    for entry in dirs:
+        results[entry] = _commit_output(store, entry)
+    return {entry.name: results[entry] for entry in items if results[entry] is not None}
 
 # ---- Main run function ----
 def run_step_file(
@@ -140,8 +182,7 @@ def run_step_file(
 
     # Compute input_hash (name + type + id, sorted by name)
     triples = [(n, v["type"], v["id"]) for n, v in sorted(inputs_map.items())]
-    from .hashing import canonical_json, sha256_bytes
-    input_hash = sha256_bytes(canonical_json(triples))
+    input_hash = hash_input_triples(triples)
 
     # Env fingerprint
     env_summary = minimal_env_summary(capture_packages=capture_packages)
@@ -162,14 +203,8 @@ def run_step_file(
 
     # Link materialized inputs into run_dir/in by name
     for name, src in materialization.items():
-        src_p = Path(src)
-        dst_p = run_dir / "in" / name
-        if src_p.is_dir():
-            # copytree for simplicity in working dir (inputs are read-only in CAS)
-            shutil.copytree(src_p, dst_p)
-        else:
-            dst_p.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(src_p, dst_p)
+        # hardlinks, not copies: inputs are read-only in CAS
+        prefer_link_tree(Path(src), run_dir / "in" / name)
 
     # Build context and execute user code
     ctx = RunContext(run_dir=run_dir, input_dir=run_dir/"in", output_dir=run_dir/"out",
@@ -183,7 +218,7 @@ def run_step_file(
 
     # Assemble manifest
     manifest = {
-        "manifest_version": 1,
+        "manifest_version": MANIFEST_VERSION,
         "run_id": run_id,
         "timestamp_utc": utc_now_iso(),
         "step": {"name": Path(step_path).stem, "path": str(Path(step_path).resolve()), "code_hash": code_h},
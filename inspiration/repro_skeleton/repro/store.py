@@ -1,16 +1,26 @@
 from __future__ import annotations
 from pathlib import Path
-import os, json, tempfile, shutil, time
-from .hashing import sha256_file, sha256_bytes, canonical_json, tree_snapshot
+import os, json, stat, tempfile, time, sqlite3, threading
+from concurrent.futures import ThreadPoolExecutor
+from .hashing import CHUNK, sha256_new, sha256_file, sha256_bytes, canonical_json, json_bytes, scan_files, tree_id_of
+
+try:  # Linux syncfs(2): flush one filesystem instead of every mounted one
+    import ctypes, ctypes.util
+    _syncfs = getattr(ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True), "syncfs", None)
+except (ImportError, OSError, TypeError):  # TypeError: no libc to load (Windows)
+    _syncfs = None
 
 """
 Content Addressed Storage (CAS) and simple layout:
 
 store/
-  blobs/sha256/ab/abcdef...     # file blobs
+  blobs/sha256/ab/abcdef...     # file blobs (read-only, mode 0444)
   trees/sha256/ab/abcdef...     # JSON snapshot for directories
   manifests/sha256/..           # run manifests (JSON)
   aliases/                      # alias files (text with 'blob:...' or 'tree:...' or 'run:...')
+  index/by_output.sqlite        # reverse index (output type, id) -> producing run_id
+  trees-materialized/<digest>/  # read-only file links of a tree, shared by aggregate_view views
+  tmp/.inode_cache.sqlite       # disposable (dev, ino, mtime, ctime, size) -> blob id cache
 """
 
 def default_store_path() -> Path:
@@ -25,38 +35,209 @@ def ensure_layout(store: Path) -> None:
     (store / "aliases").mkdir(parents=True, exist_ok=True)
     (store / "tmp").mkdir(parents=True, exist_ok=True)
 
+BLOB_MODE = 0o444  # blobs are immutable; links handed out must not be writable aliases
+
 def _fanout_dir(store: Path, kind: str, digest_hex: str) -> Path:
     return store / f"{kind}/sha256" / digest_hex[:2] / digest_hex[2:]
 
-def _atomic_write_bytes(path: Path, data: bytes) -> None:
+def _atomic_write_bytes(path: Path, data: bytes, durable: bool = True) -> None:
+    """
+    Write via a temp file + rename. durable=False skips the fsync, for callers
+    that flush the whole batch with _sync_store afterwards.
+    """
     path.parent.mkdir(parents=True, exist_ok=True)
     tmp = path.with_suffix(".tmp-" + str(time.time_ns()))
     with open(tmp, "wb") as f:
         f.write(data)
-        f.flush()
-        os.fsync(f.fileno())
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
     os.replace(tmp, path)
 
+def _sync_store(store: Path) -> bool:
+    """
+    Flush everything written to the store's filesystem in one call:
+    syncfs(2) where available, else os.sync(). False if neither exists,
+    in which case callers must fsync per file.
+    """
+    if _syncfs is not None:
+        fd = os.open(store, os.O_RDONLY)
+        try:
+            if _syncfs(fd) == 0:
+                return True
+        finally:
+            os.close(fd)
+    if hasattr(os, "sync"):
+        os.sync()
+        return True
+    return False
+
+def _can_batch_sync() -> bool:
+    return _syncfs is not None or hasattr(os, "sync")
+
 # ---- Blobs (files) ----
-def commit_blob(store: Path, src: Path) -> str:
+def _write_all(fdst, view: memoryview) -> None:
+    # unbuffered (raw) writes may be partial, e.g. when the disk fills up
+    while view:
+        view = view[fdst.write(view):]
+
+def _copy_into(fsrc, fdst) -> None:
+    """
+    Copy fsrc into fdst, in-kernel where the platform allows:
+    copy_file_range (may reflink) > sendfile > userspace read/write loop.
+    Each step resumes from the current file offsets if the previous one fails.
+    """
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+    step = 1 << 30  # keep below per-call limits (e.g. sendfile's ~2GiB)
+    if hasattr(os, "copy_file_range"):
+        try:
+            while os.copy_file_range(in_fd, out_fd, step):
+                pass
+            return
+        except OSError:
+            pass
+    if hasattr(os, "sendfile"):
+        try:
+            while os.sendfile(out_fd, in_fd, None, step):
+                pass
+            return
+        except OSError:
+            pass
+    buf = bytearray(CHUNK)
+    view = memoryview(buf)
+    while True:
+        n = fsrc.readinto(buf)
+        if not n:
+            break
+        _write_all(fdst, view[:n])
+
+def _hash_and_write(src: Path | str, tmp_dst: Path, durable: bool = True) -> str:
+    """
+    Copy src to tmp_dst while hashing it, so the source is read only once.
+    Returns the blob id 'sha256:...'.
+    """
+    h = sha256_new()
+    buf = bytearray(CHUNK)
+    view = memoryview(buf)
+    with open(src, "rb", buffering=0) as fsrc, open(tmp_dst, "wb", buffering=0) as fdst:
+        while True:
+            n = fsrc.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+            _write_all(fdst, view[:n])
+        if durable:
+            os.fsync(fdst.fileno())
+    return "sha256:" + h.hexdigest()
+
+def commit_blob(store: Path, src: Path | str, link_ok: bool = False, durable: bool = True) -> str:
     """
     Copy/commit a file into CAS under blobs/ by its sha256 id.
     Returns id like 'sha256:abcdef...'.
+    With link_ok the blob may take over src's inode via a hardlink (zero bytes
+    copied); only for sources nothing else will modify, e.g. run outputs that
+    are deleted after commit (src then becomes read-only along with the blob).
+    Files with other links or symlinks are copied.
+    Copied sources are remembered by inode, mtime, ctime and size in an inode cache,
+    so committing an unchanged file again skips reading and hashing it.
+    durable=False skips the per-blob fsync; the caller must _sync_store.
     """
-    blob_id = sha256_file(src)
-    digest_hex = blob_id.split(":", 1)[1]
-    dst = _fanout_dir(store, "blobs", digest_hex)
-    if dst.exists():
+    if link_ok:
+        st = os.lstat(src)
+        if stat.S_ISREG(st.st_mode) and st.st_nlink == 1:
+            blob_id = sha256_file(src)
+            dst = _fanout_dir(store, "blobs", blob_id.split(":", 1)[1])
+            if dst.exists():
+                return blob_id
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            # tmp is per-thread, since identical files may be committed concurrently
+            tmp = dst.with_suffix(f".tmp-{os.getpid()}-{threading.get_ident()}")
+            try:
+                os.link(src, tmp, follow_symlinks=False)
+            except OSError:  # e.g. EXDEV: store on another filesystem
+                with open(src, "rb", buffering=0) as fsrc, open(tmp, "wb", buffering=0) as fdst:
+                    _copy_into(fsrc, fdst)
+                    if durable:
+                        os.fsync(fdst.fileno())
+            else:
+                if durable:  # the blob is src's inode: flush its data as a copy would be
+                    fd = os.open(tmp, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+            os.chmod(tmp, BLOB_MODE)
+            os.replace(tmp, dst)
+            return blob_id
+    # Unchanged since it was last committed: the blob is already in CAS
+    st = os.stat(src)
+    blob_id = _inode_cache_get(store, st)
+    if blob_id and _fanout_dir(store, "blobs", blob_id.split(":", 1)[1]).exists():
+        return blob_id
+    # Single pass: stream into a private temp file under store/tmp while hashing,
+    # then move it to its content address (or drop it if the blob exists)
+    tmp_dir = store / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix="blob-", dir=tmp_dir)
+    os.close(fd)
+    tmp = Path(tmp_name)
+    try:
+        blob_id = _hash_and_write(src, tmp, durable)
+        if _same_file_state(st, os.stat(src)):  # not modified while we read it
+            _inode_cache_put(store, st, blob_id)
+        dst = _fanout_dir(store, "blobs", blob_id.split(":", 1)[1])
+        if dst.exists():
+            return blob_id
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        os.chmod(tmp, BLOB_MODE)
+        os.replace(tmp, dst)
         return blob_id
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    # Write atomically: copy to tmp then rename
-    tmp = dst.with_suffix(".tmp")
-    with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
-        shutil.copyfileobj(fsrc, fdst, length=1024 * 1024 * 8)
-        fdst.flush()
-        os.fsync(fdst.fileno())
-    os.replace(tmp, dst)
-    return blob_id
+    finally:
+        tmp.unlink(missing_ok=True)
+
+# ---- Inode cache: (dev, ino) + (mtime, ctime, size) -> blob id, like git's index ----
+_INODE_CACHE = threading.local()
+_RACY_NS = 2 * 10**9  # files modified this recently may change within one mtime tick
+
+def _inode_cache(store: Path) -> sqlite3.Connection:
+    """
+    Per-thread connection to store/tmp/.inode_cache.sqlite. The cache is
+    disposable (a miss just rehashes), so durability is traded for speed.
+    """
+    cons = getattr(_INODE_CACHE, "cons", None)
+    if cons is None:
+        cons = _INODE_CACHE.cons = {}
+    con = cons.get(store)
+    if con is None:
+        p = store / "tmp" / ".inode_cache.sqlite"
+        p.parent.mkdir(parents=True, exist_ok=True)
+        con = sqlite3.connect(p, timeout=30, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=OFF")
+        # ctime too (like git's index): in-place rewrites that restore the mtime
+        # (cp -p, rsync -t, tar, os.utime) still bump it
+        con.execute("CREATE TABLE IF NOT EXISTS file_state(dev INTEGER, ino INTEGER, mtime INTEGER, "
+                    "ctime INTEGER, size INTEGER, blob TEXT, PRIMARY KEY(dev, ino))")
+        cons[store] = con
+    return con
+
+def _file_state(st: os.stat_result) -> tuple:
+    return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_ctime_ns, st.st_size)
+
+def _same_file_state(a: os.stat_result, b: os.stat_result) -> bool:
+    return _file_state(a) == _file_state(b)
+
+def _inode_cache_get(store: Path, st: os.stat_result) -> str | None:
+    row = _inode_cache(store).execute(
+        "SELECT blob FROM file_state WHERE dev=? AND ino=? AND mtime=? AND ctime=? AND size=?",
+        _file_state(st)).fetchone()
+    return row[0] if row else None
+
+def _inode_cache_put(store: Path, st: os.stat_result, blob_id: str) -> None:
+    if time.time_ns() - max(st.st_mtime_ns, st.st_ctime_ns) < _RACY_NS:
+        return  # racily clean: a same-tick rewrite would go unnoticed
+    _inode_cache(store).execute("INSERT OR REPLACE INTO file_state VALUES (?, ?, ?, ?, ?, ?)",
+                                (*_file_state(st), blob_id))
 
 def blob_path(store: Path, blob_id: str) -> Path:
     assert blob_id.startswith("sha256:"), "blob id must be 'sha256:...'"
@@ -64,20 +245,32 @@ def blob_path(store: Path, blob_id: str) -> Path:
     return _fanout_dir(store, "blobs", digest_hex)
 
 # ---- Trees (directories) ----
-def commit_tree(store: Path, src_dir: Path):
+def commit_tree(store: Path, src_dir: Path, link_ok: bool = False):
     """
     Commit a directory snapshot. Each file becomes a blob; the tree is a JSON snapshot.
-    Returns ('tree:sha256:...', entries)
+    Returns ('tree:sha256:...', entries). link_ok is passed on to commit_blob.
+    Blob ids come from commit_blob itself, so each file is read at most once
+    (not at all when the inode cache knows it) and the tree id follows from them.
+    Blobs are written without fsync and flushed by one filesystem sync before
+    the tree file is (durably) written, so a tree never references lost blobs.
     """
-    tree_id, entries = tree_snapshot(src_dir)
-    digest_hex = tree_id.split(":", 1)[1]
-    tree_file = _fanout_dir(store, "trees", digest_hex)
+    src_s = os.fspath(src_dir)
+    files = scan_files(src_dir)
+    batch = _can_batch_sync()
+    def commit_one(item: tuple[str, int]) -> dict:
+        rel, size = item
+        blob_id = commit_blob(store, os.path.join(src_s, rel), link_ok, not batch)
+        return {"path": rel, "blob": blob_id, "size": int(size)}
+    # in parallel (CAS writes are idempotent); map() keeps the sorted order
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        entries = list(ex.map(commit_one, files))
+    tree_id = tree_id_of(entries)
+    tree_file = _fanout_dir(store, "trees", tree_id.split(":", 1)[1])
     if not tree_file.exists():
-        # Ensure all blobs exist first
-        for e in entries:
-            commit_blob(store, src_dir / e["path"])
+        if batch:
+            _sync_store(store)
         data = {"version": 1, "entries": entries}
-        _atomic_write_bytes(tree_file, json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        _atomic_write_bytes(tree_file, json_bytes(data, sort_keys=True))
     return "tree:" + tree_id, entries
 
 def read_tree(store: Path, tree_typed_id: str):
@@ -99,12 +292,79 @@ def manifest_path(store: Path, run_id: str) -> Path:
 
 def write_manifest(store: Path, run_id: str, manifest: dict) -> None:
     p = manifest_path(store, run_id)
-    _atomic_write_bytes(p, json.dumps(manifest, indent=2, ensure_ascii=False).encode("utf-8"))
+    _atomic_write_bytes(p, json_bytes(manifest, indent=True))
+    index_outputs(store, run_id, manifest)
 
 def load_manifest(store: Path, run_id: str) -> dict:
     p = manifest_path(store, run_id)
     return json.loads(p.read_text(encoding="utf-8"))
 
+# ---- Output index (who-built lookups) ----
+def output_index_path(store: Path) -> Path:
+    return store / "index" / "by_output.sqlite"
+
+def _open_output_index(store: Path, backfill: bool = True) -> sqlite3.Connection:
+    """
+    Open (creating if needed) the reverse index out2run(kind, id) -> run_id.
+    A new index is backfilled from the manifests already in the store, so it
+    stays authoritative for stores that predate it.
+    """
+    p = output_index_path(store)
+    fresh = not p.exists()
+    p.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(p)
+    with con:
+        con.execute("CREATE TABLE IF NOT EXISTS out2run("
+                    "kind TEXT, id TEXT, run_id TEXT, PRIMARY KEY(kind, id))")
+        if fresh and backfill:
+            _backfill_outputs(con, store)
+    return con
+
+def _backfill_outputs(con: sqlite3.Connection, store: Path) -> int:
+    mfs = sorted((store / "manifests/sha256").glob("*/*.json"))
+    for mf in mfs:
+        m = json.loads(mf.read_text(encoding="utf-8"))
+        _insert_outputs(con, m["run_id"], m)
+    return len(mfs)
+
+def _insert_outputs(con: sqlite3.Connection, run_id: str, manifest: dict) -> None:
+    # first producer wins, matching what a manifest scan would report
+    rows = [(o["type"], o["id"], run_id) for o in manifest.get("outputs", [])]
+    con.executemany("INSERT OR IGNORE INTO out2run VALUES (?, ?, ?)", rows)
+
+def index_outputs(store: Path, run_id: str, manifest: dict) -> None:
+    con = _open_output_index(store)
+    try:
+        with con:
+            _insert_outputs(con, run_id, manifest)
+    finally:
+        con.close()
+
+def reindex_outputs(store: Path) -> int:
+    """
+    Add every manifest in the store to the index and return how many were read.
+    Needed after manifests are copied in from elsewhere, since only manifest
+    writes (and the first backfill) update the index.
+    """
+    con = _open_output_index(store, backfill=False)
+    try:
+        with con:
+            return _backfill_outputs(con, store)
+    finally:
+        con.close()
+
+def lookup_output(store: Path, kind: str, id_hex: str) -> str | None:
+    """
+    Return the run_id that produced output (kind, id_hex) according to the index.
+    Callers should check output_index_path(store) exists first; a miss is final.
+    """
+    con = sqlite3.connect(output_index_path(store))
+    try:
+        row = con.execute("SELECT run_id FROM out2run WHERE kind=? AND id=?", (kind, id_hex)).fetchone()
+    finally:
+        con.close()
+    return row[0] if row else None
+
 # ---- Aliases ----
 def alias_path(store: Path, name: str) -> Path:
     return (store / "aliases" / name).resolve()
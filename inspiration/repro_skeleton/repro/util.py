@@ -1,35 +1,100 @@
 from __future__ import annotations
-import shutil, os
+import shutil, os, stat
 from pathlib import Path
 
-def prefer_link(src: Path, dst: Path) -> str:
+def _link_or_copy(src: Path, dst: Path) -> str:
     """
-    Try symlink > hardlink > copy. Returns the method used.
+    Create dst from src: symlink > hardlink > copy.
+    Raises FileExistsError (dst present) or FileNotFoundError (parent missing).
     """
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    # If destination exists, remove it (simple behavior for skeleton)
-    if dst.exists():
-        if dst.is_dir() and not dst.is_symlink():
-            shutil.rmtree(dst)
-        else:
-            dst.unlink()
     # Symlink
     try:
         os.symlink(src, dst)
         return "symlink"
+    except (FileExistsError, FileNotFoundError):
+        raise
     except Exception:
         pass
     # Hardlink
-    try:
-        if src.is_dir():
-            raise OSError("hardlink-dir-not-supported")
-        os.link(src, dst)
-        return "hardlink"
-    except Exception:
-        pass
+    src_is_dir = src.is_dir()
+    if not src_is_dir:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except FileExistsError:
+            raise
+        except Exception:
+            pass
     # Copy (file or directory)
-    if src.is_dir():
-        shutil.copytree(src, dst)
-    else:
+    copy_writable(src, dst)
+    return "copy"
+
+def copy_writable(src: Path | str, dst: Path | str) -> None:
+    """
+    shutil.copy2 (copytree for directories), then add the owner's write bit:
+    sources are often read-only CAS blobs, but a copy belongs to its user.
+    """
+    if not os.path.isdir(src):
         shutil.copy2(src, dst)
+        _add_user_write(dst)
+        return
+    shutil.copytree(src, dst)
+    for base, dirs, files in os.walk(dst):
+        _add_user_write(base)
+        for name in files:
+            _add_user_write(os.path.join(base, name))
+
+def _add_user_write(p: Path | str) -> None:
+    os.chmod(p, os.stat(p).st_mode | stat.S_IWUSR)
+
+def prefer_link(src: Path, dst: Path) -> str:
+    """
+    Try symlink > hardlink > copy. Returns the method used.
+    Optimistic: the common fresh-destination case is a single symlink() call;
+    the parent is only created, or an existing dst only removed, on failure.
+    """
+    try:
+        return _link_or_copy(src, dst)
+    except FileNotFoundError:
+        dst.parent.mkdir(parents=True, exist_ok=True)
+    except FileExistsError:
+        # If destination exists, remove it (simple behavior for skeleton)
+        if dst.is_dir() and not dst.is_symlink():
+            shutil.rmtree(dst)
+        else:
+            dst.unlink()
+    return _link_or_copy(src, dst)
+
+def _link_file(src: Path, dst: Path) -> str:
+    # resolve first: a symlinked src links the real file (e.g. the CAS blob);
+    # os.link(follow_symlinks=True) is not honoured everywhere
+    real = os.path.realpath(src)
+    # only share files we cannot write: a writable hardlink would let the
+    # step modify the CAS blob (always the case for root, or pre-0444 blobs)
+    if not os.access(real, os.W_OK):
+        try:
+            os.link(real, dst)
+            return "hardlink"
+        except (OSError, NotImplementedError):  # e.g. EXDEV across filesystems
+            pass
+    copy_writable(real, dst)  # a private, writable copy
     return "copy"
+
+def prefer_link_tree(src: Path, dst: Path) -> str:
+    """
+    Mirror src (a file or directory, symlinks followed) at dst: directories are
+    created, read-only files (CAS blobs) hardlinked, anything writable or
+    unlinkable copied, so dst never aliases a file the caller could modify.
+    Returns 'hardlink' if every file was linked, else 'copy'.
+    """
+    if not src.is_dir():
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        return _link_file(src, dst)
+    used = "hardlink"
+    for base, dirs, files in os.walk(src, followlinks=True):
+        out = dst / os.path.relpath(base, src)
+        out.mkdir(parents=True, exist_ok=True)
+        for name in files:
+            if _link_file(Path(base, name), out / name) == "copy":
+                used = "copy"
+    return used
@@ -0,0 +1,91 @@
+# Run from the skeleton root: python -m unittest discover -s tests
+from __future__ import annotations
+import sys, tempfile, textwrap, unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from repro.runner import run_step_file
+from repro.store import load_manifest, blob_path
+
+DIR_STEP = textwrap.dedent('''
+    from repro.decorators import load, core, save
+
+    @load
+    def load_names(ctx):
+        return sorted(p.relative_to(ctx.input_dir / "data").as_posix()
+                      for p in (ctx.input_dir / "data").rglob("*") if p.is_file())
+
+    @core
+    def core_logic(ctx, names):
+        return names
+
+    @save
+    def save_names(ctx, names):
+        (ctx.output_dir / "names.txt").write_text("\\n".join(names), encoding="utf-8")
+''')
+
+STATEFUL_STEP = textwrap.dedent('''
+    from repro.decorators import load, core, save
+
+    CALLS = []
+
+    @load
+    def load_nothing(ctx):
+        return None
+
+    @core
+    def core_logic(ctx, _):
+        CALLS.append(ctx.params.get("n"))
+        return len(CALLS)
+
+    @save
+    def save_count(ctx, count):
+        (ctx.output_dir / "count.txt").write_text(str(count), encoding="utf-8")
+''')
+
+class DirectoryInputTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self.addCleanup(self._tmp.cleanup)
+        indir = self.tmp / "indir"
+        (indir / "sub").mkdir(parents=True)
+        (indir / "a.txt").write_text("a", encoding="utf-8")
+        (indir / "sub" / "b.txt").write_text("b", encoding="utf-8")
+        self.step = self.tmp / "dirstep.py"
+        self.step.write_text(DIR_STEP, encoding="utf-8")
+        self.store = self.tmp / "store"
+
+    def run_step(self):
+        return run_step_file(str(self.step), str(self.store), {}, {}, {"data": "@" + str(self.tmp / "indir")})
+
+    def test_adopted_directory_input(self):
+        run_id = self.run_step()
+        self.assertTrue(run_id.startswith("sha256:"))
+        m = load_manifest(self.store, run_id)
+        self.assertEqual([i["type"] for i in m["inputs"]], ["dir"])
+        self.assertEqual([o["logical_name"] for o in m["outputs"]], ["names.txt"])
+        # same code, inputs and params -> same run id
+        self.assertEqual(self.run_step(), run_id)
+
+class ModuleStateTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self.addCleanup(self._tmp.cleanup)
+        self.step = self.tmp / "stateful.py"
+        self.step.write_text(STATEFUL_STEP, encoding="utf-8")
+        self.store = self.tmp / "store"
+
+    def count_after_run(self, n):
+        run_id = run_step_file(str(self.step), str(self.store), {"n": n}, {"n": "cli"}, {})
+        out = load_manifest(self.store, run_id)["outputs"][0]
+        return blob_path(self.store, "sha256:" + out["id"]).read_text(encoding="utf-8")
+
+    def test_module_globals_do_not_leak_between_runs(self):
+        self.assertEqual(self.count_after_run(1), "1")
+        self.assertEqual(self.count_after_run(2), "1")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+# Run from the skeleton root: python -m unittest discover -s tests
+from __future__ import annotations
+import io, json, os, sys, tempfile, unittest
+from unittest import mock
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from repro import hashing as hashing_mod, store as store_mod
+from repro.cli import _who_built_scan
+from repro.hashing import sha256_bytes, tree_snapshot
+from repro.store import ensure_layout, manifest_path, write_manifest, _write_all
+from repro.store import commit_blob, commit_tree, _inode_cache_get
+from repro.store import output_index_path, lookup_output, reindex_outputs
+
+def _manifest(run_id: str, blob_hex: str) -> dict:
+    return {"manifest_version": 2, "run_id": run_id,
+            "outputs": [{"logical_name": "o.txt", "type": "file", "id": blob_hex, "size": 1}]}
+
+class OutputIndexTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.store = Path(self._tmp.name) / "store"
+        ensure_layout(self.store)
+
+    def copy_in(self, run_id: str, blob_hex: str) -> None:
+        # a manifest placed in the store without going through write_manifest
+        p = manifest_path(self.store, run_id)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(json.dumps(_manifest(run_id, blob_hex)), encoding="utf-8")
+
+    def test_write_indexes_outputs(self):
+        write_manifest(self.store, "sha256:" + "1" * 64, _manifest("sha256:" + "1" * 64, "a" * 64))
+        self.assertTrue(output_index_path(self.store).exists())
+        self.assertEqual(lookup_output(self.store, "file", "a" * 64), "sha256:" + "1" * 64)
+        self.assertIsNone(lookup_output(self.store, "dir", "a" * 64))
+
+    def test_first_write_backfills_existing_manifests(self):
+        self.copy_in("sha256:" + "1" * 64, "a" * 64)
+        write_manifest(self.store, "sha256:" + "2" * 64, _manifest("sha256:" + "2" * 64, "b" * 64))
+        self.assertEqual(lookup_output(self.store, "file", "a" * 64), "sha256:" + "1" * 64)
+        self.assertEqual(lookup_output(self.store, "file", "b" * 64), "sha256:" + "2" * 64)
+
+    def test_who_built_scans_without_index(self):
+        self.copy_in("sha256:" + "1" * 64, "a" * 64)
+        self.assertEqual(_who_built_scan(self.store, "blob:sha256:" + "a" * 64), "sha256:" + "1" * 64)
+
+    def test_index_miss_is_final_until_reindex(self):
+        write_manifest(self.store, "sha256:" + "1" * 64, _manifest("sha256:" + "1" * 64, "a" * 64))
+        self.copy_in("sha256:" + "2" * 64, "b" * 64)
+        self.assertIsNone(_who_built_scan(self.store, "blob:sha256:" + "b" * 64))
+        self.assertEqual(reindex_outputs(self.store), 2)
+        self.assertEqual(_who_built_scan(self.store, "blob:sha256:" + "b" * 64), "sha256:" + "2" * 64)
+        self.assertEqual(_who_built_scan(self.store, "blob:sha256:" + "a" * 64), "sha256:" + "1" * 64)
+
+def _no_reads(*args, **kwargs):
+    raise AssertionError("file was read although the inode cache knows it")
+
+class InodeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.tmp = Path(self._tmp.name)
+        self.store = self.tmp / "store"
+        ensure_layout(self.store)
+        self.src = self.tmp / "src"
+        (self.src / "sub").mkdir(parents=True)
+        (self.src / "a.txt").write_bytes(b"alpha")
+        (self.src / "sub" / "b.txt").write_bytes(b"bravo")
+
+    def test_racily_clean_file_is_not_cached(self):
+        f = self.src / "a.txt"  # just written, so within _RACY_NS
+        self.assertEqual(commit_blob(self.store, f), sha256_bytes(b"alpha"))
+        self.assertIsNone(_inode_cache_get(self.store, os.stat(f)))
+
+    @mock.patch.object(store_mod, "_RACY_NS", 0)
+    def test_unchanged_file_is_not_reread(self):
+        f = self.src / "a.txt"
+        blob_id = commit_blob(self.store, f)
+        self.assertEqual(_inode_cache_get(self.store, os.stat(f)), blob_id)
+        with mock.patch.object(store_mod, "_hash_and_write", _no_reads):
+            self.assertEqual(commit_blob(self.store, f), blob_id)
+
+    @mock.patch.object(store_mod, "_RACY_NS", 0)
+    def test_rewrite_with_restored_mtime_is_rehashed(self):
+        f = self.src / "a.txt"
+        commit_blob(self.store, f)
+        st = os.stat(f)
+        with open(f, "r+b") as fh:  # same inode, same size
+            fh.write(b"ALPHA")
+        os.utime(f, ns=(st.st_atime_ns, st.st_mtime_ns))  # mtime restored, ctime bumped
+        self.assertEqual(commit_blob(self.store, f), sha256_bytes(b"ALPHA"))
+
+    @mock.patch.object(store_mod, "_RACY_NS", 0)
+    def test_commit_tree_uses_the_cache(self):
+        # a new tree is read once, by the single-pass copy; no separate hashing pass
+        with mock.patch.object(store_mod, "sha256_file", _no_reads), \
+             mock.patch.object(hashing_mod, "sha256_file", _no_reads):
+            tree_id, entries = commit_tree(self.store, self.src)
+        self.assertEqual(tree_id, "tree:" + tree_snapshot(self.src)[0])
+        with mock.patch.object(store_mod, "_hash_and_write", _no_reads), \
+             mock.patch.object(hashing_mod, "sha256_file", _no_reads):
+            self.assertEqual(commit_tree(self.store, self.src), (tree_id, entries))
+
+class _ShortWriter(io.RawIOBase):
+    """Raw writer that accepts at most 3 bytes per call, like a nearly full disk."""
+    def __init__(self):
+        self.data = bytearray()
+    def writable(self):
+        return True
+    def write(self, b):
+        n = min(3, len(b))
+        self.data += bytes(b[:n])
+        return n
+
+class WriteAllTest(unittest.TestCase):
+    def test_partial_raw_writes_are_completed(self):
+        w = _ShortWriter()
+        _write_all(w, memoryview(b"0123456789abcdef"))
+        self.assertEqual(bytes(w.data), b"0123456789abcdef")
+
+if __name__ == "__main__":
+    unittest.main()